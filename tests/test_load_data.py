@@ -0,0 +1,127 @@
+import pathlib
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+_SRC = pathlib.Path(__file__).resolve().parents[1] / "v12.py"
+TZ = "America/New_York"
+
+
+class FakeYahoo:
+    # 按交易時段 (平日 09:30-15:55, 5m) 產生 K 線，只返回 now 之前的數據
+    def __init__(self):
+        self.now = None
+        self.calls = []
+        self.unknown = set()
+
+    def _sessions(self, n):
+        day = self.now.normalize()
+        out = []
+        while len(out) < n:
+            if day.weekday() < 5 and self.now >= day + pd.Timedelta(hours=9, minutes=30):
+                out.append(day)
+            day -= pd.Timedelta(days=1)
+        return out[::-1]
+
+    def download(self, tickers=None, period=None, interval=None, group_by=None, **kw):
+        import yfinance as yf
+
+        self.calls.append((tickers, period))
+        yf.shared._ERRORS = {}
+        n = {"1d": 1, "5d": 5}.get(period, 21)
+        idx = pd.DatetimeIndex([])
+        for day in self._sessions(n):
+            idx = idx.append(pd.date_range(day + pd.Timedelta(hours=9, minutes=30), day + pd.Timedelta(hours=15, minutes=55), freq="5min"))
+        idx = idx[idx <= self.now]
+        syms = tickers.split()
+        frames = {}
+        for s in syms:
+            if s in self.unknown:
+                yf.shared._ERRORS[s] = f"YFPricesMissingError('${s}: possibly delisted; no price data found')"
+                continue
+            c = 100 + np.sin(idx.asi8 / 1e12 + len(s))
+            frames[s] = pd.DataFrame({"Open": c, "High": c + 1, "Low": c - 1, "Close": c, "Volume": 1e5}, index=idx)
+        if not frames: return pd.DataFrame()
+        df = pd.concat(frames, axis=1)
+        return df if group_by == "ticker" else df.swaplevel(axis=1)
+
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    # v12.py 是 Streamlit 腳本：只執行到側邊欄之前 (函數定義部分)，並替換 yf.download
+    monkeypatch.setenv("HOME", str(tmp_path))
+    import streamlit as st
+    import yfinance as yf
+
+    fake = FakeYahoo()
+    monkeypatch.setattr(yf, "download", fake.download)
+    src = _SRC.read_text(encoding="utf-8")
+    ns = {"__name__": "__main__", "__file__": str(_SRC)}
+    exec(compile(src[:src.index("# --- 6.")], str(_SRC), "exec"), ns)
+    st.cache_data.clear()
+    for k in list(st.session_state.keys()):
+        del st.session_state[k]
+    ns["fake"] = fake
+    return ns
+
+
+def _tail_calls(fake):
+    return [c for c in fake.calls if c[1] in ("1d", "5d")]
+
+
+def test_snapshot_before_open_needs_one_tail_download_per_refresh(app):
+    fake, symbols = app["fake"], ("TSLA", "NIO")
+    fake.now = pd.Timestamp("2026-03-10 00:05", tz=TZ)
+    app["_load_history"](symbols, "1mo", "5m", date.today().isoformat())
+    for bucket, t in enumerate(["10:00", "10:05", "13:00"]):
+        fake.now = pd.Timestamp(f"2026-03-10 {t}", tz=TZ)
+        fake.calls.clear()
+        data = app["load_data"](symbols, "1mo", "5m", bucket)
+        assert _tail_calls(fake) == [("TSLA NIO", "1d")]
+        df, state = data["TSLA"]
+        assert state is not None and df.index.is_unique
+        assert pd.Timestamp("2026-03-09 15:55", tz=TZ) in df.index
+        assert len(df) == len(app["_load_history"](symbols, "1mo", "5m", date.today().isoformat())["TSLA"][0])
+
+
+def test_mid_session_snapshot_refetches_5d_once(app):
+    fake, symbols = app["fake"], ("TSLA", "NIO")
+    fake.now = pd.Timestamp("2026-03-09 12:00", tz=TZ)
+    app["_load_history"](symbols, "1mo", "5m", date.today().isoformat())
+    fake.now = pd.Timestamp("2026-03-10 10:00", tz=TZ)
+    fake.calls.clear()
+    df, _ = app["load_data"](symbols, "1mo", "5m", 1)["TSLA"]
+    assert _tail_calls(fake) == [("TSLA NIO", "1d"), ("TSLA NIO", "5d")]
+    assert pd.Timestamp("2026-03-09 15:55", tz=TZ) in df.index
+    fake.now = pd.Timestamp("2026-03-10 10:05", tz=TZ)
+    fake.calls.clear()
+    app["load_data"](symbols, "1mo", "5m", 2)
+    assert _tail_calls(fake) == [("TSLA NIO", "5d")]
+
+
+def test_history_misses_share_one_batch_and_unknown_symbols_are_cached(app):
+    fake, day = app["fake"], date.today().isoformat()
+    fake.now = pd.Timestamp("2026-03-10 00:05", tz=TZ)
+    fake.unknown = {"ZZZZ"}
+    history = app["_load_history"](("TSLA", "NIO", "ZZZZ"), "1mo", "5m", day)
+    assert fake.calls == [("TSLA NIO ZZZZ", "1mo")]
+    assert set(history) == {"TSLA", "NIO"}
+    fake.calls.clear()
+    history = app["_load_history"](("TSLA", "NIO", "ZZZZ", "AAPL", "MSFT"), "1mo", "5m", day)
+    assert fake.calls == [("AAPL MSFT", "1mo")]
+    assert set(history) == {"TSLA", "NIO", "AAPL", "MSFT"}
+
+
+def test_trimmed_concat_keeps_incremental_emas(app):
+    fake, symbols = app["fake"], ("TSLA", "NIO")
+    fake.now = pd.Timestamp("2026-03-10 00:05", tz=TZ)
+    hist_df = app["_load_history"](symbols, "1mo", "5m", date.today().isoformat())["TSLA"][0]
+    fake.now = pd.Timestamp("2026-03-10 13:00", tz=TZ)
+    df, state = app["load_data"](symbols, "1mo", "5m", 1)["TSLA"]
+    assert df.index[0] > hist_df.index[0]
+    out, _ = app["compute_indicators"](df.copy(), state)
+    full = pd.concat([hist_df[df.columns], df.loc[df.index > hist_df.index[-1]]])
+    ref, _ = app["compute_indicators"](full.copy())
+    np.testing.assert_allclose(out["EMA200"], ref["EMA200"].loc[df.index], rtol=1e-5)
@@ -0,0 +1,32 @@
+import ast
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+# v12.py 是 Streamlit 腳本，import 會直接啟動頁面；只抽出 _sma 的定義來測
+_SRC = pathlib.Path(__file__).resolve().parents[1] / "v12.py"
+_tree = ast.parse(_SRC.read_text(encoding="utf-8"))
+_node = next(n for n in _tree.body if isinstance(n, ast.FunctionDef) and n.name == "_sma")
+_ns = {"np": np}
+exec(compile(ast.Module(body=[_node], type_ignores=[]), str(_SRC), "exec"), _ns)
+_sma = _ns["_sma"]
+
+
+def test_matches_rolling_mean():
+    v = np.random.default_rng(0).integers(1e5, 1e7, 300).astype(float)
+    np.testing.assert_allclose(_sma(v, 20), pd.Series(v).rolling(20).mean().to_numpy(), rtol=1e-12)
+
+
+def test_nan_only_blanks_windows_containing_it():
+    v = np.arange(60, dtype=float)
+    v[10] = np.nan
+    expected = pd.Series(v).rolling(20).mean().to_numpy()
+    out = _sma(v, 20)
+    np.testing.assert_array_equal(np.isnan(out), np.isnan(expected))
+    np.testing.assert_allclose(out[~np.isnan(out)], expected[~np.isnan(expected)])
+    np.testing.assert_allclose(out[-3:], [47.5, 48.5, 49.5])
+
+
+def test_shorter_than_window_is_all_nan():
+    assert np.isnan(_sma(np.ones(5), 20)).all()
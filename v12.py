@@ -4,10 +4,13 @@ import pandas as pd
 import numpy as np
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from datetime import datetime
+from datetime import datetime, date
 import time
 import requests
 import re
+from collections import defaultdict
+from numba import njit
+from concurrent.futures import ThreadPoolExecutor
 
 # --- 1. 頁面配置與 CSS ---
 st.set_page_config(page_title="多股實時監控系統", layout="wide")
@@ -25,70 +28,258 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- 2. Telegram 通知 ---
-def send_telegram_msg(sym, action, reason, price, p_change, v_ratio):
+@st.cache_resource
+def get_tg_creds():
+    return st.secrets["TELEGRAM_BOT_TOKEN"], st.secrets["TELEGRAM_CHAT_ID"]
+
+@st.cache_resource
+def get_tg_session():
+    # 跨刷新共用連線 (HTTP keep-alive)，省去每次 TLS 握手
+    return requests.Session()
+
+def format_telegram_msg(sym, action, reason, price, p_change, v_ratio):
+    return (
+        f"🔔 【{action}預警】: {sym}\n"
+        f"現價: {price:.2f} ({p_change:+.2f}%)\n"
+        f"量比: {v_ratio:.1f}x\n"
+        f"--------------------\n"
+        f"📋 判定根據:\n{reason}"
+    )
+
+def send_telegram_msgs(messages):
+    # 同一輪刷新觸發的預警一次並行送出，共用同一 Session 的連線池
+    if not messages: return
     try:
-        token = st.secrets["TELEGRAM_BOT_TOKEN"]
-        chat_id = st.secrets["TELEGRAM_CHAT_ID"]
-        message = (
-            f"🔔 【{action}預警】: {sym}\n"
-            f"現價: {price:.2f} ({p_change:+.2f}%)\n"
-            f"量比: {v_ratio:.1f}x\n"
-            f"--------------------\n"
-            f"📋 判定根據:\n{reason}"
-        )
+        token, chat_id = get_tg_creds()
         url = f"https://api.telegram.org/bot{token}/sendMessage"
-        params = {"chat_id": chat_id, "text": message}
-        requests.get(url, params=params, timeout=5)
+        session = get_tg_session()
+        with ThreadPoolExecutor(max_workers=min(8, len(messages))) as ex:
+            list(ex.map(lambda m: session.get(url, params={"chat_id": chat_id, "text": m}, timeout=5), messages))
     except Exception as e:
         st.error(f"Telegram 發送失敗: {e}")
 
 # --- 3. 數據獲取 ---
+# get_signal 只讀最後 10 根，預先抽成連續 ndarray
+TAIL_COLS = ['High', 'Low', 'Close', 'Volume', 'Vol_Avg', 'Hist', 'bull_trend', 'bear_trend']
+# 只保留圖表與信號用得到的欄位；EMA60/MACD/Sig 僅作中間量
+IND_COLS = ['EMA20', 'EMA200', 'Hist', 'bull_trend', 'bear_trend']
+EMA_SPANS = np.array([20.0, 60.0, 200.0, 12.0, 26.0])
+SIG_SPAN = np.array([9.0])
+
+@njit(cache=True, nogil=True)
+def _emas(close, spans, init):
+    # 單次遍歷同時計算多條 EMA (等同 ewm(span, adjust=False))，從 init 狀態續算；NaN 沿用上一值
+    # 輸出與 alpha 跟隨 close 的 dtype，float32 輸入全程保持 32 位
+    n, k = close.shape[0], spans.shape[0]
+    alphas = (2.0 / (spans + 1.0)).astype(close.dtype)
+    out = np.empty((n, k), close.dtype)
+    ema = init.astype(close.dtype)
+    for i in range(n):
+        x = close[i]
+        for j in range(k):
+            if not np.isnan(x):
+                ema[j] = x if np.isnan(ema[j]) else ema[j] + alphas[j] * (x - ema[j])
+            out[i, j] = ema[j]
+    return out
+
+def _sma(v, w):
+    # cumsum 差分求定長 SMA，等同 rolling(w).mean()：NaN 以 0 累加並另計有效數，含 NaN 的窗口輸出 NaN
+    out = np.full(v.shape[0], np.nan)
+    if v.shape[0] >= w:
+        valid = ~np.isnan(v)
+        cs = np.concatenate(([0.0], np.cumsum(np.where(valid, v, 0.0))))
+        cnt = np.concatenate(([0], np.cumsum(valid)))
+        out[w - 1:] = np.where(cnt[w:] - cnt[:-w] == w, (cs[w:] - cs[:-w]) / w, np.nan)
+    return out
+
+def _clean(df):
+    # 輸入已是單層欄位 (批次切片或 _flatten_columns 之後)
+    if df.columns.has_duplicates:
+        df = df.loc[:, ~df.columns.duplicated()]
+    # OHLCV 降為 float32，指標計算與圖表序列化的數據量減半
+    return df.astype(np.float32)
+
+def _flatten_columns(df):
+    # 單代碼下載視 yfinance 版本可能帶 (Price, Ticker) 兩層欄位
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.get_level_values(0)
+    return df
+
 def fetch_data(symbol, p, i):
     try:
         df = yf.download(symbol, period=p, interval=i, progress=False)
         if df.empty: return None
-        if isinstance(df.columns, pd.MultiIndex):
-            df.columns = df.columns.get_level_values(0)
-        df = df.loc[:, ~df.columns.duplicated()].copy()
-        close = df['Close'].squeeze()
-        df['EMA20'] = close.ewm(span=20, adjust=False).mean()
-        df['EMA60'] = close.ewm(span=60, adjust=False).mean()
-        df['EMA200'] = close.ewm(span=200, adjust=False).mean()
-        df['Vol_Avg'] = df['Volume'].rolling(window=20).mean()
-        ema12 = close.ewm(span=12, adjust=False).mean()
-        ema26 = close.ewm(span=26, adjust=False).mean()
-        df['MACD'] = ema12 - ema26
-        df['Sig'] = df['MACD'].ewm(span=9, adjust=False).mean()
-        df['Hist'] = df['MACD'] - df['Sig']
-        return df
+        return _clean(_flatten_columns(df))
     except: return None
 
+def fetch_batch(symbols, p, i):
+    # 多個代碼合併為一次請求；group_by='ticker' 固定為 (Ticker, Price) 兩層，raw[sym] 即單層欄位
+    try:
+        raw = yf.download(tickers=' '.join(symbols), period=p, interval=i, group_by='ticker', progress=False, threads=True)
+    except: return {}
+    tickers = set(raw.columns.get_level_values(0))
+    out = {}
+    for sym in symbols:
+        if sym not in tickers: continue
+        df = raw[sym].dropna(how='all')
+        if not df.empty: out[sym] = _clean(df)
+    return out
+
+def compute_indicators(df, state=None):
+    # 冷啟動全量計算；之後只把 state['last_ts'] 之後的新 K 線折入 EMA 狀態
+    # state: {'last_ts', 'ema': EMA20/60/200/12/26, 'sig', 'ind': 已收盤 K 線的指標}
+    close = df['Close'].to_numpy()
+    start, ema_init, sig_init = 0, np.full(5, np.nan), np.full(1, np.nan)
+    if state is not None and state['last_ts'] in df.index and df.index[0] >= state['ind'].index[0] \
+            and list(state['ind'].columns) == IND_COLS:
+        start = df.index.get_loc(state['last_ts']) + 1
+        ema_init, sig_init = state['ema'], state['sig']
+    ema = _emas(close[start:], EMA_SPANS, ema_init)
+    macd = ema[:, 3] - ema[:, 4]
+    sig = _emas(macd, SIG_SPAN, sig_init)
+    new = {
+        'EMA20': ema[:, 0], 'EMA200': ema[:, 2], 'Hist': macd - sig[:, 0],
+        'bull_trend': (close[start:] > ema[:, 2]) & (ema[:, 0] > ema[:, 1]),
+        'bear_trend': (close[start:] < ema[:, 2]) & (ema[:, 0] < ema[:, 1]),
+    }
+    old = state['ind'].reindex(df.index[:start]) if start else None
+    for c in IND_COLS:
+        df[c] = np.concatenate((old[c].to_numpy(), new[c])) if start else new[c]
+    df['Vol_Avg'] = _sma(df['Volume'].to_numpy(dtype=np.float64), 20).astype(np.float32)
+    df.attrs['tail_np'] = df[TAIL_COLS].tail(10).to_numpy(dtype=np.float64)
+
+    # 最後一根 K 線未收盤，狀態只推進到倒數第二根
+    closed = len(df) - 2 - start
+    if closed >= 0:
+        state = {'last_ts': df.index[-2], 'ema': ema[closed], 'sig': sig[closed], 'ind': df[IND_COLS].iloc[:-1]}
+    elif start == 0:
+        state = None
+    return df, state
+
+def _download(symbols, p, i):
+    # 多代碼走批次下載；批次中缺失的 (及單代碼) 再並行逐個抓取
+    data = fetch_batch(symbols, p, i) if len(symbols) > 1 else {}
+    missing = [s for s in symbols if s not in data]
+    if missing:
+        with ThreadPoolExecutor(max_workers=min(16, len(missing))) as ex:
+            for sym, df in zip(missing, ex.map(lambda s: fetch_data(s, p, i), missing)):
+                if df is not None: data[sym] = df
+    return data
+
+class _HistoryMiss(Exception):
+    pass
+
+# 每個代碼的完整區間連同指標與 EMA 狀態按日持久化到磁碟 (persist 不支援 ttl，以 day 換 key)，重啟後不必重抓重算
+@st.cache_data(persist="disk", max_entries=64, show_spinner=False)
+def _fetch_history(sym, p, i, day, _prefetched=None):
+    # 未命中時拋出異常 (異常不會被快取)，由 _load_history 合併為一次批次下載後再帶 _prefetched 寫入
+    if _prefetched is None or sym not in _prefetched: raise _HistoryMiss(sym)
+    df = _prefetched[sym]
+    # None 表示 Yahoo 回報代碼不存在，當日同樣快取，不再每輪重抓
+    return None if df is None else compute_indicators(df)
+
+def _load_history(symbols, p, i, day):
+    # 已快取的代碼逐個命中；未命中的合併為一次 fetch_batch，增減代碼不影響其他代碼
+    history, missing = {}, []
+    for sym in symbols:
+        try: history[sym] = _fetch_history(sym, p, i, day)
+        except _HistoryMiss: missing.append(sym)
+    if missing:
+        fetched = fetch_batch(missing, p, i)
+        for sym in missing:
+            # 下載失敗的代碼不寫入快取，下一輪刷新只重抓這些代碼
+            if sym not in fetched and 'possibly delisted' in yf.shared._ERRORS.get(sym.upper(), ''):
+                fetched[sym] = None
+            try: history[sym] = _fetch_history(sym, p, i, day, fetched)
+            except _HistoryMiss: pass
+    return {sym: h for sym, h in history.items() if h is not None}
+
+# bucket = int(time.time() // refresh_rate)，每個刷新週期換一次 key；ttl 取刷新頻率上限兜底
+@st.cache_data(ttl=600, max_entries=128, show_spinner=False)
+def _fetch_tail(symbols, p, i, bucket):
+    return _download(symbols, p, i)
+
+def _has_gap(hist_df, tail_df):
+    # 尾段與歷史重疊，或歷史止於上一交易時段的收盤 K 線且尾段從下一個交易日開始，都算連續
+    if hist_df is None or tail_df is None: return False
+    h_last, t_first = hist_df.index[-1], tail_df.index[0]
+    if h_last.tz is not None: t_first = t_first.tz_convert(h_last.tz)
+    if t_first <= h_last: return False
+    days = hist_df.index.normalize()
+    earlier = hist_df.index[days < days[-1]]
+    if len(earlier) == 0: return True
+    # 收盤時刻取此前各時段最後一根 K 線的最晚時刻
+    closed = h_last - days[-1] >= (earlier - earlier.normalize()).max()
+    return not (closed and np.busday_count(h_last.date(), t_first.date()) <= 1)
+
+def load_data(symbols, p, i, bucket):
+    # 歷史 + 最新尾段拼接，返回 {sym: (OHLCV, 歷史 EMA 狀態)}；指標由 compute_indicators 只補算新 K 線
+    day = date.today().isoformat()
+    history = _load_history(symbols, p, i, day)
+    # 日內週期先取 1d 尾段 (只含最近一個交易時段)；歷史快照若停在交易時段中途 (如伺服器午夜落在
+    # 美股盤中)，下一時段的尾段會與之脫節，此時改取 5d 尾段補齊，並記住當日直接取 5d；日線直接取 5d
+    gap_key = (day, i, symbols)
+    if i == "1d" or st.session_state.get('_tail_5d') == gap_key:
+        tail = _fetch_tail(symbols, "5d", i, bucket)
+    else:
+        tail = _fetch_tail(symbols, "1d", i, bucket)
+        if any(_has_gap(history.get(s, (None,))[0], tail.get(s)) for s in symbols):
+            st.session_state['_tail_5d'] = gap_key
+            tail = _fetch_tail(symbols, "5d", i, bucket)
+    out = {}
+    for sym in symbols:
+        hist_df, hist_state = history.get(sym, (None, None))
+        tail_df = tail.get(sym)
+        if _has_gap(hist_df, tail_df):
+            # 仍有缺口則不拼接，只用連續的尾段冷啟動
+            out[sym] = (tail_df, None)
+        elif hist_df is None:
+            if tail_df is not None: out[sym] = (tail_df, None)
+        elif tail_df is None:
+            out[sym] = (hist_df, hist_state)
+        else:
+            # 拼接後只保留歷史快照的長度，丟掉最舊的 K 線，範圍不隨盤中刷新越拉越長
+            df = pd.concat([hist_df.loc[hist_df.index < tail_df.index[0], tail_df.columns], tail_df])
+            out[sym] = (df.iloc[-len(hist_df):], hist_state)
+    return out
+
 # --- 4. 價格水平預警解析與判定 ---
-def check_custom_alerts(sym, price, alert_str):
-    # 支援格式: TSLA>420, AAPL<150 (逗號或換行分隔)
-    alerts = re.split(r'[,\n]', alert_str)
-    for a in alerts:
-        a = a.strip().upper()
-        if not a: continue
-        # 解析 "代碼>價格" 或 "代碼升穿價格" 等邏輯
-        match = re.search(rf"{sym}\s*([><]|升穿|跌穿)\s*(\d+\.?\d*)", a)
-        if match:
-            op = match.group(1)
-            target_price = float(match.group(2))
-            if (op in ['>', '升穿'] and price >= target_price) or \
-               (op in ['<', '跌穿'] and price <= target_price):
-                return True, f"🎯 自定義價格預警: {a} (現價:{price:.2f})"
+# 支援格式: TSLA>420, AAPL<150, TSLA 升穿 420, GC=F>2000 (逗號或換行分隔)
+ALERT_RE = re.compile(r"([A-Z0-9.\-^=]+)\s*([><]|升穿|跌穿)\s*(\d+\.?\d*)")
+
+def parse_custom_alerts(alert_str):
+    # 每輪刷新解析一次，按代碼分組: {sym: [(op, 目標價, 原文), ...]}
+    alerts_by_sym = defaultdict(list)
+    for m in ALERT_RE.finditer(alert_str.upper()):
+        alerts_by_sym[m.group(1)].append((m.group(2), float(m.group(3)), m.group(0)))
+    return alerts_by_sym
+
+def check_custom_alerts(sym, price, alerts_by_sym):
+    for op, target_price, text in alerts_by_sym.get(sym, ()):
+        if (op in ['>', '升穿'] and price >= target_price) or \
+           (op in ['<', '跌穿'] and price <= target_price):
+            return True, f"🎯 自定義價格預警: {text} (現價:{price:.2f})"
     return False, ""
 
 # --- 5. 綜合信號判定 ---
-def get_signal(df, p_limit, v_limit, sym, use_breakout, use_macd_flip, custom_alert_input):
-    if len(df) < 10: return "⏳ 載入中", "#aaaaaa", "數據不足", False, ""
-    
-    last = df.iloc[-1]
-    prev = df.iloc[-2]
-    price = float(last['Close'])
-    p_change = ((price - float(prev['Close'])) / float(prev['Close'])) * 100
-    v_ratio = float(last['Volume']) / float(last['Vol_Avg']) if last['Vol_Avg'] > 0 else 1
+def get_signal(df, p_limit, v_limit, sym, use_breakout, use_macd_flip, alerts_by_sym, pending_alerts):
+    if len(df) < 10: return "⏳ 載入中", "#aaaaaa", "數據不足", ""
+    # 尾段 (含 Hist/趨勢等指標，隨範圍與歷史深度變化) 與判定參數都沒變時，直接沿用上次結果
+    tail = df.attrs['tail_np']
+    key = (df.index[-1], tail.tobytes(), p_limit, v_limit, use_breakout, use_macd_flip, tuple(alerts_by_sym.get(sym, ())))
+    sig_cache = st.session_state.setdefault('_sig_cache', {})
+    if sym in sig_cache and sig_cache[sym][0] == key: return sig_cache[sym][1]
+    result = _compute_signal(df, p_limit, v_limit, sym, use_breakout, use_macd_flip, alerts_by_sym, pending_alerts)
+    sig_cache[sym] = (key, result)
+    return result
+
+def _compute_signal(df, p_limit, v_limit, sym, use_breakout, use_macd_flip, alerts_by_sym, pending_alerts):
+    # 所有條件共用同一份尾段 ndarray (欄位見 TAIL_COLS)
+    tail = df.attrs['tail_np']
+    price, vol, vavg = tail[-1, 2:5]
+    prev_c = tail[-2, 2]
+    p_change = ((price - prev_c) / prev_c) * 100
+    v_ratio = vol / vavg if vavg > 0 else 1
     
     reasons = []
     trigger_alert = False
@@ -96,14 +287,13 @@ def get_signal(df, p_limit, v_limit, sym, use_breakout, use_macd_flip, custom_al
     card_style = ""
 
     # [1] 自定義價格水平監控 (優先觸發)
-    hit_custom, custom_reason = check_custom_alerts(sym, price, custom_alert_input)
+    hit_custom, custom_reason = check_custom_alerts(sym, price, alerts_by_sym)
     if hit_custom:
         trigger_alert, action_type, card_style = True, "🎯 價格觸達", "blink-bull" if p_change > 0 else "blink-bear"
         reasons.append(custom_reason)
 
     # [2] 均線量價/5K突破/MACD翻轉邏輯
-    is_bull_trend = price > last['EMA200'] and last['EMA20'] > last['EMA60']
-    is_bear_trend = price < last['EMA200'] and last['EMA20'] < last['EMA60']
+    is_bull_trend, is_bear_trend = bool(tail[-1, 6]), bool(tail[-1, 7])
     
     # 判斷各種子條件
     base_bull = is_bull_trend and p_change >= p_limit and v_ratio >= v_limit
@@ -111,14 +301,15 @@ def get_signal(df, p_limit, v_limit, sym, use_breakout, use_macd_flip, custom_al
     
     is_break_high, is_break_low = False, False
     if use_breakout:
-        max_h5 = df.iloc[-6:-1]['High'].max(); min_l5 = df.iloc[-6:-1]['Low'].min()
+        max_h5 = tail[-6:-1, 0].max(); min_l5 = tail[-6:-1, 1].min()
         is_break_high, is_break_low = price > max_h5, price < min_l5
 
     macd_bull_flip, macd_bear_flip = False, False
     if use_macd_flip and len(df) >= 8:
-        hist_window = df['Hist'].iloc[-8:].values
-        macd_bull_flip = all(x < 0 for x in hist_window[:-1]) and hist_window[-1] > 0
-        macd_bear_flip = all(x > 0 for x in hist_window[:-1]) and hist_window[-1] < 0
+        hist_window = tail[-8:, 5]
+        hist_prev, hist_last = hist_window[:-1], hist_window[-1]
+        macd_bull_flip = bool(np.all(hist_prev < 0)) and hist_last > 0
+        macd_bear_flip = bool(np.all(hist_prev > 0)) and hist_last < 0
 
     # 彙整預警 (做多類)
     if base_bull or (use_breakout and is_break_high) or macd_bull_flip:
@@ -137,7 +328,11 @@ def get_signal(df, p_limit, v_limit, sym, use_breakout, use_macd_flip, custom_al
         if macd_bear_flip: reasons.append("Waves MACD: 7正轉1負")
 
     if trigger_alert:
-        send_telegram_msg(sym, action_type, "\n".join(reasons), price, p_change, v_ratio)
+        # 同一根 K 線的同類預警只推送一次；先排入 pending_alerts，整輪結束後批次發送
+        tg_sent = st.session_state.setdefault('_tg_sent', {})
+        if tg_sent.get(sym) != (df.index[-1], action_type):
+            tg_sent[sym] = (df.index[-1], action_type)
+            pending_alerts.append(format_telegram_msg(sym, action_type, "\n".join(reasons), price, p_change, v_ratio))
 
     status, color = ("🚀 做多", "#00ff00") if is_bull_trend else ("🔻 做空", "#ff4b4b") if is_bear_trend else ("⚖️ 觀望", "#aaaaaa")
     if action_type: status = action_type
@@ -173,43 +368,74 @@ with st.sidebar:
     use_macd_flip = st.checkbox("MACD 7+1 反轉監控", value=False)
 
 # --- 7. 主介面 ---
+CARD_HTML = """
+<div class='{card_style}' style='border:1px solid #444; padding:15px; border-radius:10px; text-align:center;'>
+    <h3 style='margin:0;'>{sym}</h3>
+    <h2 style='color:{color}; margin:10px 0;'>{status}</h2>
+    <p style='font-size:1.3em; margin:0;'><b>{price:.2f}</b></p>
+    <hr style='margin:10px 0; border:0.5px solid #333;'>
+    <p style='font-size:0.8em; color:#ffa500;'>{alert_msg}</p>
+</div>
+"""
+
 st.title("📈 智能監控與 Telegram 預警系統")
-placeholder = st.empty()
 
-while True:
+# 警報區與圖表區各自為 fragment，定時只重跑這兩塊，側邊欄與頁面其餘部分保持不動
+@st.fragment(run_every=refresh_rate)
+def alert_panel():
     all_data = {}
-    with placeholder.container():
-        st.subheader("🔍 即時警報摘要")
-        if symbols:
-            cols = st.columns(len(symbols))
-            for i, sym in enumerate(symbols):
-                df = fetch_data(sym, sel_period, sel_interval)
-                if df is not None:
-                    all_data[sym] = df
-                    # 傳入自定義預警參數 (MODIFIED)
-                    status, color, alert_msg, card_style = get_signal(df, price_threshold, vol_threshold, sym, use_breakout, use_macd_flip, custom_alert_input)
-                    cols[i].markdown(f"""
-                        <div class='{card_style}' style='border:1px solid #444; padding:15px; border-radius:10px; text-align:center;'>
-                            <h3 style='margin:0;'>{sym}</h3>
-                            <h2 style='color:{color}; margin:10px 0;'>{status}</h2>
-                            <p style='font-size:1.3em; margin:0;'><b>{df['Close'].iloc[-1]:.2f}</b></p>
-                            <hr style='margin:10px 0; border:0.5px solid #333;'>
-                            <p style='font-size:0.8em; color:#ffa500;'>{alert_msg}</p>
-                        </div>
-                    """, unsafe_allow_html=True)
-        st.divider()
-        if all_data:
-            tabs = st.tabs(list(all_data.keys()))
-            for i, (sym, df) in enumerate(all_data.items()):
-                with tabs[i]:
-                    plot_df = df.tail(35).copy()
-                    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.03, row_heights=[0.7, 0.3])
-                    fig.add_trace(go.Candlestick(x=plot_df.index, open=plot_df['Open'], high=plot_df['High'], low=plot_df['Low'], close=plot_df['Close'], name='K線'), row=1, col=1)
-                    fig.add_trace(go.Scatter(x=plot_df.index, y=plot_df['EMA20'], name='EMA20', line=dict(color='yellow', width=1)), row=1, col=1)
-                    fig.add_trace(go.Scatter(x=plot_df.index, y=plot_df['EMA200'], name='EMA200', line=dict(color='red', width=1.5)), row=1, col=1)
-                    colors = ['#00ff00' if x >= 0 else '#ff4b4b' for x in plot_df['Hist']]
-                    fig.add_trace(go.Bar(x=plot_df.index, y=plot_df['Hist'], name='MACD Hist', marker_color=colors), row=2, col=1)
-                    fig.update_layout(height=500, template="plotly_dark", xaxis_rangeslider_visible=False, margin=dict(l=10,r=10,t=10,b=10))
-                    st.plotly_chart(fig, use_container_width=True, key=f"fig_{sym}")
-        st.caption(f"📅 更新: {datetime.now().strftime('%H:%M:%S')}")
-    time.sleep(refresh_rate)
+    bucket = int(time.time() // refresh_rate)
+    alerts_by_sym = parse_custom_alerts(custom_alert_input)
+    pending_alerts = []
+    st.subheader("🔍 即時警報摘要")
+    if symbols:
+        cols = st.columns(len(symbols))
+        data = load_data(tuple(symbols), sel_period, sel_interval, bucket)
+        for i, sym in enumerate(symbols):
+            if sym in data:
+                # 本會話已有狀態則續算，否則從磁碟歷史的狀態起步
+                df, hist_state = data[sym]
+                state_key = f'state_{sym}_{sel_interval}'
+                df, st.session_state[state_key] = compute_indicators(df, st.session_state.get(state_key) or hist_state)
+                all_data[sym] = df
+                # 傳入自定義預警參數 (MODIFIED)
+                status, color, alert_msg, card_style = get_signal(df, price_threshold, vol_threshold, sym, use_breakout, use_macd_flip, alerts_by_sym, pending_alerts)
+                # 卡片內容未變則直接沿用上次生成的 HTML
+                card_key = (sym, status, color, alert_msg, card_style, round(float(df.attrs['tail_np'][-1, 2]), 4))
+                if st.session_state.get(f'last_{sym}') != card_key:
+                    st.session_state[f'html_{sym}'] = CARD_HTML.format(sym=sym, status=status, color=color, price=card_key[-1], alert_msg=alert_msg, card_style=card_style)
+                    st.session_state[f'last_{sym}'] = card_key
+                cols[i].markdown(st.session_state[f'html_{sym}'], unsafe_allow_html=True)
+        send_telegram_msgs(pending_alerts)
+    st.session_state['all_data'] = all_data
+    st.caption(f"📅 更新: {datetime.now().strftime('%H:%M:%S')}")
+    st.divider()
+
+@st.cache_resource
+def base_fig():
+    # 子圖網格與版面只建一次，各代碼複製後再加 trace
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, vertical_spacing=0.03, row_heights=[0.7, 0.3])
+    fig.update_layout(height=500, template="plotly_dark", xaxis_rangeslider_visible=False, margin=dict(l=10,r=10,t=10,b=10))
+    return fig
+
+# 切換代碼只重跑本 fragment；數據取自 alert_panel 最近一次的結果
+@st.fragment(run_every=refresh_rate)
+def chart_panel():
+    if not symbols: return
+    # 只繪製選中的代碼，取代逐個 tab 建圖
+    if st.session_state.get('active_tab') not in symbols:
+        st.session_state['active_tab'] = symbols[0]
+    sym = st.radio("📊 圖表", symbols, horizontal=True, key='active_tab', label_visibility="collapsed")
+    df = st.session_state.get('all_data', {}).get(sym)
+    if df is None: return
+    plot_df = df.tail(35)
+    fig = go.Figure(base_fig())
+    fig.add_trace(go.Candlestick(x=plot_df.index, open=plot_df['Open'], high=plot_df['High'], low=plot_df['Low'], close=plot_df['Close'], name='K線'), row=1, col=1)
+    fig.add_trace(go.Scatter(x=plot_df.index, y=plot_df['EMA20'], name='EMA20', line=dict(color='yellow', width=1)), row=1, col=1)
+    fig.add_trace(go.Scatter(x=plot_df.index, y=plot_df['EMA200'], name='EMA200', line=dict(color='red', width=1.5)), row=1, col=1)
+    colors = np.where(plot_df['Hist'].to_numpy() >= 0, '#00ff00', '#ff4b4b')
+    fig.add_trace(go.Bar(x=plot_df.index, y=plot_df['Hist'], name='MACD Hist', marker_color=colors), row=2, col=1)
+    st.plotly_chart(fig, use_container_width=True, key=f"fig_{sym}")
+
+alert_panel()
+chart_panel()